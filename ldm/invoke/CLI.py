@@ -47,6 +47,7 @@ def main():
 
     # alert - setting globals here
     Globals.try_patchmatch = args.patchmatch
+    Globals.refresh_concepts = args.refresh_concepts
 
     print(f'>> InvokeAI runtime directory is "{Globals.root}"')
 
@@ -482,6 +482,12 @@ class Args(object):
             default=True,
             help='Load the patchmatch extension for outpainting. Use --no-patchmatch to disable.',
         )
+        model_group.add_argument(
+            '--refresh_concepts',
+            dest='refresh_concepts',
+            action='store_true',
+            help='Ignore the locally cached list of Hugging Face concepts and download it again',
+        )
         file_group.add_argument(
             '--from_file',
             dest='infile',
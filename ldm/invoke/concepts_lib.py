@@ -6,38 +6,76 @@ The interface is through the Concepts() object.
 """
 import os
 import re
+import sys
+import json
+import time
+import shutil
 import traceback
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Callable
-from urllib import request, error as ul_error
-from huggingface_hub import HfFolder, hf_hub_url, ModelSearchArguments, ModelFilter, HfApi
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+from huggingface_hub import HfFolder, hf_hub_url, ModelSearchArguments, HfApi
 from ldm.invoke.globals import Globals
 
+try:
+    import ahocorasick
+    ahocorasick_available = True
+except (ImportError,ModuleNotFoundError):
+    ahocorasick_available = False
+
+# how long (in seconds) the on-disk list of library concepts is considered current
+CONCEPT_INDEX_TTL = 24 * 60 * 60
+
+# with fewer known triggers than this, building an Aho-Corasick automaton costs more than it saves
+AUTOMATON_MIN_TRIGGERS = 32
+
+_MATCH_TRIGGER = re.compile(r'(<[\w\- ]+>)') # trigger is slightly less restrictive than HF concept name
+_MATCH_CONCEPT = re.compile(r'<([\w\-]+)>')  # HF concept name can only contain A-Za-z0-9_-
+
 class Concepts(object):
     def __init__(self, root=None):
         '''
         Initialize the Concepts object. May optionally pass a root directory.
         '''
         self.root = root or Globals.root
+        self._concepts_base = os.path.join(self.root,'models','sd-concepts-library') + os.sep
         self.hf_api = HfApi()
+        self._session = None
         self.concept_list = None
         self.concepts_loaded = dict()
         self.triggers = dict()            # concept name to trigger phrase
         self.concept_names = dict()       # trigger phrase to concept name
-        self.match_trigger = re.compile('(<[\w\- >]+>)') # trigger is slightly less restrictive than HF concept name
-        self.match_concept = re.compile('<([\w\-]+)>') # HF concept name can only contain A-Za-z0-9_-
+        self._triggers_loaded = False
+        self._downloaded_concepts = None  # names of the concept directories present locally
+        self._concept_files = dict()      # (concept name, file name) to resolved path
+        self._automaton = None            # Aho-Corasick automaton over the known triggers
+        self._automaton_size = 0
+        self.match_trigger = _MATCH_TRIGGER
+        self.match_concept = _MATCH_CONCEPT
 
     def list_concepts(self)->list:
         '''
         Return a list of all the concepts by name, without the 'sd-concepts-library' part.
+        The list is cached on disk for CONCEPT_INDEX_TTL seconds; set
+        Globals.refresh_concepts to force it to be fetched again.
         '''
         if self.concept_list is not None:
             return self.concept_list
+        index_path = self._concept_index_path()
+        if not Globals.refresh_concepts:
+            self.concept_list = self._read_concept_index(index_path, max_age=CONCEPT_INDEX_TTL)
+            if self.concept_list is not None:
+                return self.concept_list
         try:
-            models = self.hf_api.list_models(filter=ModelFilter(model_name='sd-concepts-library/'))
-            self.concept_list = [a.id.split('/')[1] for a in models]
+            self.concept_list = self._fetch_concept_index(index_path)
         except Exception as e:
             print(f' ** WARNING: Hugging Face textual inversion concepts libraries could not be loaded. The error was {str(e)}.')
             print(' ** You may load .bin and .pt file(s) manually using the --embedding_directory argument.')
+            # an out-of-date list is better than none
+            self.concept_list = self._read_concept_index(index_path)
         return self.concept_list
 
     def get_concept_model_path(self, concept_name:str)->str:
@@ -53,6 +91,9 @@ class Concepts(object):
         Given a concept name returns its trigger by looking in the
         "token_identifier.txt" file.
         '''
+        if concept_name in self.triggers:
+            return self.triggers[concept_name]
+        self._load_all_triggers()
         if concept_name in self.triggers:
             return self.triggers[concept_name]
         file = self.get_concept_file(concept_name, 'token_identifier.txt', local_only=True)
@@ -61,6 +102,7 @@ class Concepts(object):
         with open(file,'r') as f:
             trigger = f.readline()
             trigger = trigger.strip()
+        concept_name, trigger = sys.intern(concept_name), sys.intern(trigger)
         self.triggers[concept_name] = trigger
         self.concept_names[trigger] = concept_name
         return trigger
@@ -68,11 +110,12 @@ class Concepts(object):
     def trigger_to_concept(self, trigger:str)->str:
         '''
         Given a trigger phrase, maps it to the concept library name.
-        Only works if concept_to_trigger() has previously been called
-        on this library. There needs to be a persistent database for
-        this.
+        Only concepts that have been downloaded locally are known.
         '''
         concept = self.concept_names.get(trigger,None)
+        if concept is None and not self._triggers_loaded:
+            self._load_all_triggers()
+            concept = self.concept_names.get(trigger,None)
         return f'<{concept}>' if concept else f'{trigger}'
 
     def replace_triggers_with_concepts(self, prompt:str)->str:
@@ -83,14 +126,25 @@ class Concepts(object):
         controlling of colliding triggers in the SD library, so it is
         better to store the concept name (unique) than the concept trigger
         (not necessarily unique!)
+
+        When the optional pyahocorasick module is installed and many
+        concepts are known, all triggers are located in a single pass of
+        an Aho-Corasick automaton rather than by the trigger regex.
         '''
-        triggers = self.match_trigger.findall(prompt)
-        if not triggers:
-            return prompt
+        automaton = self._trigger_automaton()
+        if automaton is None:
+            def do_replace(match)->str:
+                return self.trigger_to_concept(match.group(1))
+            return self.match_trigger.sub(do_replace, prompt)
 
-        def do_replace(match)->str:
-            return self.trigger_to_concept(match.group(1)) or f'<{match.group(1)}>'
-        return self.match_trigger.sub(do_replace, prompt)
+        pieces = list()
+        start = 0
+        for end, (trigger, concept) in automaton.iter_long(prompt):
+            pieces.append(prompt[start:end-len(trigger)+1])
+            pieces.append(f'<{concept}>')
+            start = end+1
+        pieces.append(prompt[start:])
+        return ''.join(pieces)
 
     def replace_concepts_with_triggers(self, prompt:str, load_concepts_callback: Callable[[list], any])->str:
         '''
@@ -100,65 +154,266 @@ class Concepts(object):
         If any `<concept_name>` tags are found, `load_concepts_callback()` is called with a list
         of `concepts_name` strings.
         '''
-        concepts = self.match_concept.findall(prompt)
-        if not concepts:
+        matches = list(self.match_concept.finditer(prompt))
+        if not matches:
             return prompt
-        load_concepts_callback(concepts)
+        load_concepts_callback([match.group(1) for match in matches])
 
-        def do_replace(match)->str:
-            return self.concept_to_trigger(match.group(1)) or f'<{match.group(1)}>'
-        return self.match_concept.sub(do_replace, prompt)
+        # splice the triggers in using the matches collected above, rather than scanning the prompt again
+        pieces = list()
+        start = 0
+        for match in matches:
+            pieces.append(prompt[start:match.start()])
+            pieces.append(self.concept_to_trigger(match.group(1)) or match.group(0))
+            start = match.end()
+        pieces.append(prompt[start:])
+        return ''.join(pieces)
 
     def get_concept_file(self, concept_name:str, file_name:str='learned_embeds.bin' , local_only:bool=False)->str:
+        key = (concept_name, file_name)
+        if key in self._concept_files:
+            return self._concept_files[key]
         if not self.concept_is_downloaded(concept_name) and not local_only:
             self.download_concept(concept_name)
         path = os.path.join(self._concept_path(concept_name), file_name)
-        return path if os.path.exists(path) else None
-        
+        if not os.path.exists(path):
+            return None
+        self._concept_files[key] = path
+        return path
+
     def concept_is_downloaded(self, concept_name)->bool:
-        concept_directory = self._concept_path(concept_name)
-        return os.path.exists(concept_directory)
-        
+        if self._downloaded_concepts is None:
+            self._refresh_downloaded()
+        return concept_name in self._downloaded_concepts
+
+    def _refresh_downloaded(self):
+        try:
+            with os.scandir(self._concepts_base) as entries:
+                self._downloaded_concepts = {entry.name for entry in entries if entry.is_dir()}
+        except OSError:
+            self._downloaded_concepts = set()
+
+    def download_concepts(self, concept_names:list)->dict:
+        '''
+        Downloads, in parallel, those of the named concepts that are not
+        already present locally. Returns a dict that maps the (lowercased)
+        name of each concept that had to be fetched to True or False,
+        according to whether its download succeeded.
+        '''
+        missing = list(dict.fromkeys(
+            name.lower() for name in concept_names if not self.concept_is_downloaded(name.lower())
+        ))
+        if len(missing) < 2:
+            return {name: self.download_concept(name) for name in missing}
+        self._get_session()  # create the shared session before the workers race to do so
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            return dict(zip(missing, executor.map(self.download_concept, missing)))
+
     def download_concept(self,concept_name)->bool:
         repo_id = self._concept_id(concept_name)
         dest = self._concept_path(concept_name)
-
-        access_token = HfFolder.get_token()
-        header = [("Authorization", f'Bearer {access_token}')] if access_token else []
-        opener = request.build_opener()
-        opener.addheaders = header
-        request.install_opener(opener)
+        session = self._get_session()
+        if self._downloaded_concepts is None:
+            self._refresh_downloaded()   # scan before this concept's directory appears
 
         os.makedirs(dest, exist_ok=True)
         succeeded = True
-        
+
         bytes = 0
-        def tally_download_size(chunk, size, total):
-            nonlocal bytes
-            if chunk==0:
-                bytes += total
+        error = None
+        files = ('README.md','learned_embeds.bin','token_identifier.txt','type_of_concept.txt')
+        # concepts may be downloading in parallel, so each reports on a single line once it is done
+        with ThreadPoolExecutor(max_workers=len(files)) as executor:
+            futures = {
+                executor.submit(self._download_file, session, hf_hub_url(repo_id, file), os.path.join(dest,file)): file
+                for file in files
+            }
+            for future in as_completed(futures):
+                try:
+                    bytes += future.result()
+                except (requests.RequestException, Urllib3HTTPError, OSError) as e:
+                    # a stream cut short surfaces as a urllib3 ProtocolError, not a requests exception
+                    error, file = e, futures[future]
+                    for f in futures:
+                        f.cancel()
+                    break
 
-        print(f'>> Downloading {repo_id}...',end='')
-        try:
-            for file in ('README.md','learned_embeds.bin','token_identifier.txt','type_of_concept.txt'):
-                url = hf_hub_url(repo_id, file)
-                request.urlretrieve(url, os.path.join(dest,file),reporthook=tally_download_size)
-        except ul_error.HTTPError as e:
-            if e.code==404:
-                print(f'This concept is not known to the Hugging Face library. Generation will continue without the concept.')
+        if isinstance(error, requests.HTTPError):
+            if error.response.status_code==404:
+                print(f'>> Downloading {repo_id}...{concept_name} is not known to the Hugging Face library. Generation will continue without the concept.')
             else:
-                print(f'Failed to download {concept_name}/{file} ({str(e)}. Generation will continue without the concept.)')
-            os.rmdir(dest)
+                print(f'>> Downloading {repo_id}...failed to download {concept_name}/{file} ({str(error)}). Generation will continue without the concept.')
+        elif error is not None:
+            print(f'>> Downloading {repo_id}...ERROR downloading {concept_name}/{file}: {str(error)}. This may reflect a network issue. Generation will continue without the concept.')
+        if error is not None:
+            shutil.rmtree(dest, ignore_errors=True)
+            self._downloaded_concepts.discard(concept_name)
             return False
-        except ul_error.URLError as e:
-            print(f'ERROR: {str(e)}. This may reflect a network issue. Generation will continue without the concept.')
-            os.rmdir(dest)
-            return False
-        print('...{:.2f}Kb'.format(bytes/1024))
+        # other concepts may be half-downloaded, so record this one rather than rescanning
+        self._downloaded_concepts.add(concept_name)
+        print('>> Downloading {}...{:.2f}Kb'.format(repo_id, bytes/1024))
         return succeeded
 
+    def _download_file(self, session:requests.Session, url:str, dest_path:str)->int:
+        '''
+        Streams url into dest_path and returns the size of the download as
+        reported by the server's Content-Length header.
+        The data is written to a ".part" file first and moved into place
+        once complete, so a partial download is never mistaken for a good one.
+        '''
+        tmpfile = f'{dest_path}.part'
+        try:
+            with session.get(url, stream=True) as r:
+                r.raise_for_status()
+                size = int(r.headers.get('Content-Length', 0))
+                r.raw.decode_content = True
+                with open(tmpfile,'wb') as f:
+                    if hasattr(os,'posix_fadvise'):
+                        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                    shutil.copyfileobj(r.raw, f, length=1<<16)
+            os.replace(tmpfile, dest_path)
+        except BaseException:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+            raise
+        return size
+
+    def _get_session(self)->requests.Session:
+        '''
+        Returns a requests.Session that is shared by all downloads made
+        through this object, so that repeated fetches from huggingface.co
+        reuse a single keep-alive connection.
+        '''
+        if self._session is None:
+            session = requests.Session()
+            access_token = HfFolder.get_token()
+            if access_token:
+                session.headers.update({'Authorization': f'Bearer {access_token}'})
+            session.mount('https://', HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.2), pool_maxsize=16))
+            self._session = session
+        return self._session
+
+    def _trigger_automaton(self):
+        '''
+        Returns an Aho-Corasick automaton that maps each known trigger to
+        its concept, rebuilding it if triggers were added since it was last
+        built. Returns None if pyahocorasick is unavailable or there are
+        too few triggers for it to pay off.
+        '''
+        if not ahocorasick_available:
+            return None
+        self._load_all_triggers()
+        if len(self.concept_names) < AUTOMATON_MIN_TRIGGERS:
+            return None
+        if self._automaton is None or self._automaton_size != len(self.concept_names):
+            automaton = ahocorasick.Automaton()
+            for trigger, concept in self.concept_names.items():
+                # only delimited triggers, as the regex would find them, so that
+                # e.g. a bare "sks" is not replaced in the middle of other words
+                if self.match_trigger.fullmatch(trigger):
+                    automaton.add_word(trigger, (trigger, concept))
+            automaton.make_automaton()
+            self._automaton, self._automaton_size = automaton, len(self.concept_names)
+        return self._automaton
+
+    def _load_all_triggers(self):
+        '''
+        Populates the trigger <-> concept name tables from the
+        token_identifier.txt files of every locally downloaded concept,
+        using a single scan of the library directory. Runs at most once.
+        '''
+        if self._triggers_loaded:
+            return
+        self._triggers_loaded = True
+        try:
+            entries = list(os.scandir(self._concepts_base))
+        except OSError:
+            return
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            try:
+                with open(os.path.join(entry.path,'token_identifier.txt'),'r') as f:
+                    trigger = f.read().splitlines()[0].strip()
+            except (OSError, IndexError):
+                continue
+            concept_name, trigger = sys.intern(entry.name), sys.intern(trigger)
+            self.triggers.setdefault(concept_name, trigger)
+            self.concept_names.setdefault(trigger, concept_name)
+
+    def _concept_index_path(self)->str:
+        return os.path.join(self._concepts_base,'.concept_index.json')
+
+    def _fetch_concept_index(self, index_path:str)->list:
+        '''
+        Fetches the list of concepts from the Hugging Face models API,
+        following the "next" links of a paginated response. Unless
+        Globals.refresh_concepts is set, the request carries the ETag saved with
+        the on-disk index, and on "304 Not Modified" the index is reused as-is.
+        The ETag only describes the first page, so it is saved only when the
+        whole list fitted on one page.
+        '''
+        session = self._get_session()
+        url = f'{self.hf_api.endpoint}/api/models'
+        params = {'author':'sd-concepts-library'}
+        etag = None if Globals.refresh_concepts else self._read_concept_etag(index_path)
+        headers = {'If-None-Match': etag} if etag else {}
+
+        resp = session.get(url, params=params, headers=headers)
+        if resp.status_code == 304 and 'next' not in resp.links:
+            concept_list = self._read_concept_index(index_path)
+            if concept_list is not None:
+                os.utime(index_path)  # restart the TTL
+                return concept_list
+        if resp.status_code == 304:
+            resp = session.get(url, params=params)
+        resp.raise_for_status()
+        etag = resp.headers.get('ETag')
+        models = resp.json()
+        next_url = resp.links.get('next', {}).get('url')
+        if next_url:
+            etag = None
+        while next_url:
+            resp = session.get(next_url)
+            resp.raise_for_status()
+            models.extend(resp.json())
+            next_url = resp.links.get('next', {}).get('url')
+        concept_list = [sys.intern(model['id'].rpartition('/')[2]) for model in models]
+        self._write_concept_index(index_path, concept_list, etag)
+        return concept_list
+
+    def _read_concept_index(self, index_path:str, max_age:float=None)->list:
+        try:
+            if max_age is not None and time.time() - os.path.getmtime(index_path) > max_age:
+                return None
+            with open(index_path,'r') as f:
+                return [sys.intern(name) for name in json.load(f)]
+        except (OSError, ValueError):
+            return None
+
+    def _read_concept_etag(self, index_path:str)->str:
+        if not os.path.exists(index_path):
+            return None
+        try:
+            with open(f'{index_path}.etag','r') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _write_concept_index(self, index_path:str, concept_list:list, etag:str=None):
+        tmpfile = f'{index_path}.tmp'
+        try:
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            with open(tmpfile,'w') as f:
+                json.dump(concept_list, f)
+            os.replace(tmpfile, index_path)
+            with open(f'{index_path}.etag','w') as f:
+                f.write(etag or '')
+        except OSError as e:
+            print(f' ** WARNING: could not cache the list of concepts in {index_path}: {str(e)}')
+
     def _concept_id(self, concept_name:str)->str:
         return f'sd-concepts-library/{concept_name}'
 
     def _concept_path(self, concept_name:str)->str:
-        return os.path.join(self.root,'models','sd-concepts-library',concept_name)
+        return self._concepts_base + concept_name   # _concepts_base already ends with os.sep
@@ -2,25 +2,39 @@
 ldm.invoke.globals defines a small number of global variables that would
 otherwise have to be passed through long and complex call chains.
 
-It defines a Namespace object named "Globals" that contains
+It defines a singleton object named "Globals" that contains
 the attributes:
 
   - root           - the root directory under which "models" and "outputs" can be found
   - initfile       - path to the initialization file
   - try_patchmatch - option to globally disable loading of 'patchmatch' module
+  - refresh_concepts - ignore the cached list of HuggingFace concepts and fetch it again
 '''
 
 import os
-from argparse import Namespace
+from dataclasses import dataclass
 
-Globals = Namespace()
+# __slots__ is spelled out rather than using dataclass(slots=True),
+# which is not available on Python 3.9.
+@dataclass
+class _Globals:
+    __slots__ = ('root','initfile','try_patchmatch','refresh_concepts')
+    root: str
+    initfile: str
+    try_patchmatch: bool
+    refresh_concepts: bool
 
-# This is usually overwritten by the command line and/or environment variables
-Globals.root = os.environ.get('INVOKEAI_ROOT') or os.path.expanduser('~/invokeai')
+Globals = _Globals(
+    # This is usually overwritten by the command line and/or environment variables
+    root = os.environ.get('INVOKEAI_ROOT') or os.path.expanduser('~/invokeai'),
 
-# Where to look for the initialization file
-Globals.initfile = 'invokeai.init'
+    # Where to look for the initialization file
+    initfile = 'invokeai.init',
 
-# Awkward workaround to disable attempted loading of pypatchmatch
-# which is causing CI tests to error out.
-Globals.try_patchmatch = True
+    # Awkward workaround to disable attempted loading of pypatchmatch
+    # which is causing CI tests to error out.
+    try_patchmatch = True,
+
+    # Force the cached index of the HuggingFace concepts library to be refreshed.
+    refresh_concepts = False,
+)
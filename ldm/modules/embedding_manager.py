@@ -214,8 +214,12 @@ class EmbeddingManager(nn.Module):
 
     def load_concepts(self, concepts:list[str], full=True):
         bin_files = list()
+        # fetch whatever is missing from the concepts library in one parallel batch
+        failed = {name for name,ok in self.concepts_library.download_concepts(
+            [c for c in concepts if c not in self.concepts_loaded]
+        ).items() if not ok}
         for concept_name in concepts:
-            if concept_name in self.concepts_loaded:
+            if concept_name in self.concepts_loaded or concept_name.lower() in failed:
                 continue
             else:
                 bin_file = self.concepts_library.get_concept_model_path(concept_name)
@@ -9,29 +9,36 @@
 print('Loading Python libraries...\n')
 import argparse
 import sys
+import io
 import os
 import re
+import json
 import warnings
 import shutil
-from urllib import request
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
+import yaml
 from omegaconf import OmegaConf
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper   # libyaml C bindings
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
 from huggingface_hub import HfFolder, hf_hub_url
 from pathlib import Path
 from typing import Union
 from getpass_asterisk import getpass_asterisk
-from transformers import CLIPTokenizer, CLIPTextModel
 from ldm.invoke.globals import Globals
 from ldm.invoke.readline import generic_completer
 
 import traceback
 import requests
-import clip
-import transformers
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import warnings
 warnings.filterwarnings('ignore')
-import torch
-transformers.logging.set_verbosity_error()
+# transformers is slow to import, so it is imported by the
+# functions that need it rather than here
 
 #--------------------------globals-----------------------
 Model_dir = 'models'
@@ -42,9 +49,78 @@ SD_Configs = './configs/stable-diffusion'
 
 assert os.path.exists(Dataset_path),"The configs directory cannot be found. Please run this script from within the invokeai runtime directory."
 
-Datasets = OmegaConf.load(Dataset_path)
+#---------------------------------------------
+# YAML is returned as plain (resolved) dicts, which are much cheaper to
+# index than OmegaConf nodes.
+def _load_yaml(path:str)->dict:
+    with open(path,'r') as f:
+        return OmegaConf.to_container(OmegaConf.create(yaml.load(f, Loader=YamlLoader) or {}), resolve=True)
+
+# Parsing YAML is slow, so keep a JSON copy of INITIAL_MODELS.yaml, which
+# is read on every run but rarely changes, next to it, tagged with the
+# mtime of the YAML it was made from. The user's models.yaml is rewritten
+# by this script each time, so it is not worth caching.
+def _load_cached_yaml(path:str)->dict:
+    mtime = os.stat(path).st_mtime
+    cache_path = f'{path}.cache.json'
+    try:
+        with open(cache_path,'r') as f:
+            cached = json.load(f)
+        if cached['mtime'] == mtime:
+            return cached['data']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    conf = _load_yaml(path)
+    try:
+        with open(cache_path,'w') as f:
+            json.dump({'mtime': mtime, 'data': conf}, f)
+    except OSError:
+        pass   # read-only location; just go without the cache
+    return conf
+
+Datasets = _load_cached_yaml(Dataset_path)
+_ALL = tuple(Datasets.keys())
+_RECOMMENDED = tuple(k for k,v in Datasets.items() if v['recommended'])
 completer = generic_completer(['yes','no'])
 
+# one keep-alive connection pool shared by all downloads
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[502,503,504]),
+))
+# (connect, read) timeouts in seconds, so that a stalled connection cannot hang the script
+_TIMEOUT = (10, 60)
+
+# checking whether a file on disk is complete should fail fast when offline,
+# so the probe gets a session of its own that does not retry
+_PROBE_SESSION = requests.Session()
+_PROBE_SESSION.mount('https://', HTTPAdapter(max_retries=Retry(0)))
+_PROBE_TIMEOUT = (3, 10)
+
+# set on ^C so that downloads running in worker threads stop early
+_cancel_downloads = threading.Event()
+
+#---------------------------------------------
+def _run_parallel(func, items, max_workers:int=4)->list:
+    '''
+    Calls func on each of items in a pool of threads and returns the results
+    in order. The pool is not used as a context manager: on ^C its pending
+    work is cancelled and the running downloads are told to stop, rather
+    than waiting for them all to finish.
+    '''
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [executor.submit(func, item) for item in items]
+        return [future.result() for future in futures]
+    except KeyboardInterrupt:
+        _cancel_downloads.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        executor.shutdown(wait=False)
+
 Config_preamble = '''# This file describes the alternative machine learning models
 # available to InvokeAI script.
 #
@@ -130,6 +206,7 @@ completely skip this step.
 #---------------------------------------------
 def select_datasets(action:str):
     done = False
+    previous_selection = None   # on "Change your selection", offer the previous answers as defaults
     while not done:
         datasets = dict()
         dflt = None   # the first model selected will be the default; TODO let user change
@@ -141,17 +218,18 @@ Choose the weight file(s) you wish to download. Before downloading you
 will be given the option to view and change your selections.
 '''
         )
-            for ds in Datasets.keys():
-                recommended = '(recommended)' if Datasets[ds]['recommended'] else ''
+            for ds in _ALL:
+                rec = Datasets[ds]['recommended']
+                recommended = '(recommended)' if rec else ''
                 print(f'[{counter}] {ds}:\n    {Datasets[ds]["description"]} {recommended}')
-                if yes_or_no('    Download?',default_yes=Datasets[ds]['recommended']):
+                default_yes = rec if previous_selection is None else ds in previous_selection
+                if yes_or_no('    Download?',default_yes=default_yes):
                     datasets[ds]=counter
                     counter += 1
         else:
-            for ds in Datasets.keys():
-                if Datasets[ds]['recommended']:
-                    datasets[ds]=counter
-                    counter += 1
+            for ds in _RECOMMENDED:
+                datasets[ds]=counter
+                counter += 1
 
         print('The following weight files will be downloaded:')
         for ds in datasets:
@@ -159,6 +237,7 @@ will be given the option to view and change your selections.
             print(f'   [{datasets[ds]}] {ds}{dflt}')
         print("*default")
         ok_to_download = yes_or_no('Ok to download?')
+        previous_selection = set(datasets)
         if not ok_to_download:
             if yes_or_no('Change your selection?'):
                 action = 'customized'
@@ -171,18 +250,11 @@ will be given the option to view and change your selections.
 
 #---------------------------------------------
 def recommended_datasets()->dict:
-    datasets = dict()
-    for ds in Datasets.keys():
-        if Datasets[ds]['recommended']:
-            datasets[ds]=True
-    return datasets
+    return dict.fromkeys(_RECOMMENDED, True)
 
 #---------------------------------------------
 def all_datasets()->dict:
-    datasets = dict()
-    for ds in Datasets.keys():
-        datasets[ds]=True
-    return datasets
+    return dict.fromkeys(_ALL, True)
 
 #-------------------------------Authenticate against Hugging Face
 def authenticate():
@@ -258,19 +330,19 @@ def migrate_models_ckpt():
 #---------------------------------------------
 def download_weight_datasets(models:dict, access_token:str):
     migrate_models_ckpt()
-    successful = dict()
-    for mod in models.keys():
-        repo_id = Datasets[mod]['repo_id']
-        filename = Datasets[mod]['file']
-        dest = os.path.join(Globals.root,Model_dir,Weights_dir)
-        success = hf_download_with_resume(
-            repo_id=repo_id,
+    dest = os.path.join(Globals.root,Model_dir,Weights_dir)
+
+    def download(mod:str)->bool:
+        return hf_download_with_resume(
+            repo_id=Datasets[mod]['repo_id'],
             model_dir=dest,
-            model_name=filename,
+            model_name=Datasets[mod]['file'],
             access_token=access_token
         )
-        if success:
-            successful[mod] = True
+
+    # the files come from independent repositories, so fetch several at once
+    results = _run_parallel(download, models.keys())
+    successful = {mod: True for mod, success in zip(models.keys(), results) if success}
     if len(successful) < len(models):
         print(f'\n\n** There were errors downloading one or more files. **')
         print('Please double-check your license agreements, and your access token.')
@@ -284,69 +356,119 @@ def download_weight_datasets(models:dict, access_token:str):
     print(f'Successfully installed {keys}')
     return successful
 
+#---------------------------------------------
+# directories already created by the downloaders, which often share one
+_dirs_created = set()
+def _ensure_dir(path:str):
+    if path not in _dirs_created:
+        os.makedirs(path, exist_ok=True)
+        _dirs_created.add(path)
+
 #---------------------------------------------
 def hf_download_with_resume(repo_id:str, model_dir:str, model_name:str, access_token:str=None)->bool:
     model_dest = os.path.join(model_dir, model_name)
-    os.makedirs(model_dir, exist_ok=True)
+    _ensure_dir(model_dir)
 
     url = hf_hub_url(repo_id, model_name)
 
     header = {"Authorization": f'Bearer {access_token}'} if access_token else {}
+    return _resumable_download(url, model_dest, model_name, header) is not None
+
+#---------------------------------------------
+def _resumable_download(url:str, model_dest:str, label:str, header:dict=None, session:requests.Session=_SESSION)->Union[str,None]:
+    '''
+    Downloads url into model_dest with a progress bar. If a partial file is
+    already present, only the missing bytes are requested.
+    Returns 'downloaded', 'skipped' if the local file was kept as it is,
+    or None on failure.
+    '''
+    if _cancel_downloads.is_set():
+        return None
+    header = dict(header or {})
     open_mode = 'wb'
     exist_size = 0
 
-    if os.path.exists(model_dest):
-        exist_size = os.path.getsize(model_dest)
+    try:
+        exist_size = os.stat(model_dest).st_size
+    except FileNotFoundError:
+        pass
+
+    if exist_size > 0:
+        # a HEAD is enough to tell whether the local copy is already complete
+        try:
+            head = _PROBE_SESSION.head(url, headers=header, allow_redirects=True, timeout=_PROBE_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout):
+            print(f'** {label}: could not check for updates (no connection?). Keeping the existing file.')
+            return 'skipped'
+        remote_size = int(head.headers.get('content-length', 0))
+        if head.ok and remote_size > 0 and exist_size == remote_size:
+            print(f'* {label}: complete file found. Skipping.')
+            return 'skipped'
         header['Range'] = f'bytes={exist_size}-'
         open_mode = 'ab'
 
-    resp = requests.get(url, headers=header, stream=True)
-    total = int(resp.headers.get('content-length', 0))
-
-    if resp.status_code==416:  # "range not satisfiable", which means nothing to return
-        print(f'* {model_name}: complete file found. Skipping.')
-        return True
-    elif resp.status_code != 200:
-        print(f'** An error occurred during downloading {model_name}: {resp.reason}')
-    elif exist_size > 0:
-        print(f'* {model_name}: partial file found. Resuming...')
-    else:
-        print(f'* {model_name}: Downloading...')
-
-    try:
-        if total < 2000:
-            print(f'*** ERROR DOWNLOADING {model_name}: {resp.text}')
-            return False
-
-        with open(model_dest, open_mode) as file, tqdm(
-                desc=model_name,
-                initial=exist_size,
-                total=total+exist_size,
-                unit='iB',
-                unit_scale=True,
-                unit_divisor=1000,
-        ) as bar:
-            for data in resp.iter_content(chunk_size=1024):
-                size = file.write(data)
-                bar.update(size)
-    except Exception as e:
-        print(f'An error occurred while downloading {model_name}: {str(e)}')
-        return False
-    return True
+    # closing the response hands its connection back to the pool, even on the early returns
+    with session.get(url, headers=header, stream=True, timeout=_TIMEOUT) as resp:
+        total = int(resp.headers.get('content-length', 0))
+
+        if resp.status_code==416:  # "range not satisfiable", which means nothing to return
+            print(f'* {label}: complete file found. Skipping.')
+            return 'skipped'
+        elif resp.status_code not in (200,206):
+            print(f'** An error occurred during downloading {label}: {resp.reason}')
+            return None
+        elif resp.status_code==200 and exist_size > 0:  # server ignored the Range header
+            print(f'* {label}: partial file found but cannot be resumed. Restarting...')
+            open_mode = 'wb'
+            exist_size = 0
+        elif exist_size > 0:
+            print(f'* {label}: partial file found. Resuming...')
+        else:
+            print(f'* {label}: Downloading...')
+
+        try:
+            if resp.status_code==200 and total < 2000:
+                print(f'*** ERROR DOWNLOADING {label}: {resp.text}')
+                return None
+
+            with open(model_dest, open_mode) as file, tqdm(
+                    desc=label,
+                    initial=exist_size,
+                    total=total+exist_size,
+                    unit='iB',
+                    unit_scale=True,
+                    unit_divisor=1000,
+            ) as bar:
+                resp.raw.decode_content = True
+                # copy in 1 MiB blocks, giving up between blocks if ^C was pressed
+                for block in iter(lambda: resp.raw.read(1024*1024), b''):
+                    if _cancel_downloads.is_set():
+                        print(f'* {label}: download cancelled')
+                        return None
+                    file.write(block)
+                    bar.update(len(block))
+        except Exception as e:
+            print(f'An error occurred while downloading {label}: {str(e)}')
+            return None
+        return 'downloaded'
 
 #---------------------------------------------
 def download_with_progress_bar(model_url:str, model_dest:str, label:str='the'):
+    # several of these run at once, so every line names the file it is about
+    name = os.path.basename(model_dest)
     try:
-        print(f'Installing {label} model file {model_url}...',end='',file=sys.stderr)
-        if not os.path.exists(model_dest):
-            os.makedirs(os.path.dirname(model_dest), exist_ok=True)
-            print('',file=sys.stderr)
-            request.urlretrieve(model_url,model_dest,ProgressBar(os.path.basename(model_dest)))
-            print('...downloaded successfully', file=sys.stderr)
+        print(f'Installing {label} model file {model_url}...',file=sys.stderr)
+        _ensure_dir(os.path.dirname(model_dest))
+        status = _resumable_download(model_url, model_dest, name)
+        if status == 'skipped':
+            print(f'...{name} exists', file=sys.stderr)
+        elif status == 'downloaded':
+            print(f'...{name} downloaded successfully', file=sys.stderr)
         else:
-            print('...exists', file=sys.stderr)
+            print(f'...{name} download failed')
+            print(f'Error downloading {label} model')
     except Exception:
-        print('...download failed')
+        print(f'...{name} download failed')
         print(f'Error downloading {label} model')
         print(traceback.format_exc())
 
@@ -356,16 +478,17 @@ def update_config_file(successfully_downloaded:dict,opt:dict):
     config_file = opt.config_file or Default_config_file
     config_file = os.path.normpath(os.path.join(Globals.root,config_file))
 
-    yaml = new_config_file_contents(successfully_downloaded,config_file)
+    contents = new_config_file_contents(successfully_downloaded,config_file)
 
     try:
-        if os.path.exists(config_file):
-            print(f'** {config_file} exists. Renaming to {config_file}.orig')
-            os.replace(config_file,f'{config_file}.orig')
         tmpfile = os.path.join(os.path.dirname(config_file),'new_config.tmp')
         with open(tmpfile, 'w') as outfile:
             outfile.write(Config_preamble)
-            outfile.write(yaml)
+            outfile.write(contents)
+        # the old file stays in place until the new one atomically replaces it
+        if os.path.exists(config_file):
+            print(f'** {config_file} exists. Saving a copy as {config_file}.orig')
+            shutil.copy2(config_file,f'{config_file}.orig')
         os.replace(tmpfile,config_file)
 
     except Exception as e:
@@ -378,9 +501,9 @@ def update_config_file(successfully_downloaded:dict,opt:dict):
 #---------------------------------------------
 def new_config_file_contents(successfully_downloaded:dict, config_file:str)->str:
     if os.path.exists(config_file):
-        conf = OmegaConf.load(config_file)
+        conf = _load_yaml(config_file)
     else:
-        conf = OmegaConf.create()
+        conf = dict()
 
     # find the VAE file, if there is one
     vaes = {}
@@ -392,6 +515,7 @@ def new_config_file_contents(successfully_downloaded:dict, config_file:str)->str
             continue
         vae_target = a[1] if len(a)>1 else 'default'
         vaes[vae_target] = Datasets[model]['file']
+    vae_patterns = [(re.compile(target, re.IGNORECASE), target) for target in vaes if target != 'default']
 
     for model in successfully_downloaded:
         if Datasets[model]['config'].startswith('VAE'): # skip VAE entries
@@ -404,32 +528,37 @@ def new_config_file_contents(successfully_downloaded:dict, config_file:str)->str
         stanza['width'] = Datasets[model]['width']
         stanza['height'] = Datasets[model]['height']
         stanza.pop('default',None)  # this will be set later
-        if vaes:
-            for target in vaes:
-                if re.search(target, model, flags=re.IGNORECASE):
-                    stanza['vae'] = os.path.normpath(os.path.join(Model_dir,Weights_dir,vaes[target]))
-                else:
-                    stanza['vae'] = os.path.normpath(os.path.join(Model_dir,Weights_dir,vaes['default']))
+        # use the first VAE whose target matches the model name, else the default VAE if there is one
+        for pattern, target in vae_patterns:
+            if pattern.search(model):
+                stanza['vae'] = os.path.normpath(os.path.join(Model_dir,Weights_dir,vaes[target]))
+                break
+        else:
+            if 'default' in vaes:
+                stanza['vae'] = os.path.normpath(os.path.join(Model_dir,Weights_dir,vaes['default']))
         # BUG - the first stanza is always the default. User should select.
         if not default_selected:
             stanza['default'] = True
             default_selected = True
         conf[model] = stanza
-    return OmegaConf.to_yaml(conf)
+    return yaml.dump(conf, Dumper=YamlDumper, default_flow_style=False, sort_keys=False, allow_unicode=True)
 
 #---------------------------------------------
 # this will preload the Bert tokenizer fles
 def download_bert():
-    print('Installing bert tokenizer (ignore deprecation errors)...', end='',file=sys.stderr)
-    with warnings.catch_warnings():
-        warnings.filterwarnings('ignore', category=DeprecationWarning)
-        from transformers import BertTokenizerFast, AutoFeatureExtractor
-        download_from_hf(BertTokenizerFast,'bert-base-uncased')
-        print('...success',file=sys.stderr)
+    from transformers import BertTokenizerFast
+    print('Installing bert tokenizer (ignore deprecation errors)...',file=sys.stderr)
+    download_from_hf(BertTokenizerFast,'bert-base-uncased')
+    print('...bert tokenizer installed',file=sys.stderr)
+
+#---------------------------------------------
+def quiet_transformers():
+    import transformers
+    transformers.logging.set_verbosity_error()
 
 #---------------------------------------------
 def download_from_hf(model_class:object, model_name:str):
-    print('',file=sys.stderr)  # to prevent tqdm from overwriting
+    quiet_transformers()
     return model_class.from_pretrained(model_name,
                                        cache_dir=os.path.join(Globals.root,Model_dir,model_name),
                                        resume_download=True
@@ -437,13 +566,12 @@ def download_from_hf(model_class:object, model_name:str):
 
 #---------------------------------------------
 def download_clip():
+    from transformers import CLIPTokenizer, CLIPTextModel
     print('Installing CLIP model (ignore deprecation errors)...',file=sys.stderr)
     version = 'openai/clip-vit-large-patch14'
-    print('Tokenizer...',file=sys.stderr, end='')
     download_from_hf(CLIPTokenizer,version)
-    print('Text model...',file=sys.stderr, end='')
     download_from_hf(CLIPTextModel,version)
-    print('...success',file=sys.stderr)
+    print('...CLIP model installed',file=sys.stderr)
 
 #---------------------------------------------
 def download_realesrgan():
@@ -454,7 +582,7 @@ def download_realesrgan():
 
 def download_gfpgan():
     print('Installing GFPGAN models...',file=sys.stderr)
-    for model in (
+    models = (
             [
                 'https://github.com/TencentARC/GFPGAN/releases/download/v1.3.0/GFPGANv1.4.pth',
                 './models/gfpgan/GFPGANv1.4.pth'
@@ -467,9 +595,11 @@ def download_gfpgan():
                 'https://github.com/xinntao/facexlib/releases/download/v0.2.2/parsing_parsenet.pth',
                 './models/gfpgan/weights/parsing_parsenet.pth'
             ],
-    ):
-        model_url,model_dest  = model[0],os.path.join(Globals.root,model[1])
-        download_with_progress_bar(model_url, model_dest, 'GFPGAN weights')
+    )
+    _run_parallel(
+        lambda model: download_with_progress_bar(model[0], os.path.join(Globals.root,model[1]), 'GFPGAN weights'),
+        models
+    )
 
 #---------------------------------------------
 def download_codeformer():
@@ -480,36 +610,30 @@ def download_codeformer():
 
 #---------------------------------------------
 def download_clipseg():
-    print('Installing clipseg model for text-based masking...',end='', file=sys.stderr)
+    print('Installing clipseg model for text-based masking...',file=sys.stderr)
     import zipfile
     try:
         model_url = 'https://owncloud.gwdg.de/index.php/s/ioHbRzFx6th32hn/download'
         model_dest = os.path.join(Globals.root,'models/clipseg/clipseg_weights')
-        weights_zip = 'models/clipseg/weights.zip'
 
         if not os.path.exists(model_dest):
             os.makedirs(os.path.dirname(model_dest), exist_ok=True)
         if not os.path.exists(f'{model_dest}/rd64-uni-refined.pth'):
-            dest = os.path.join(Globals.root,weights_zip)
-            request.urlretrieve(model_url,dest)
-            with zipfile.ZipFile(dest,'r') as zip:
+            # extract straight from memory rather than staging the archive on disk
+            with _SESSION.get(model_url, timeout=_TIMEOUT) as resp:
+                resp.raise_for_status()
+                buf = io.BytesIO(resp.content)
+            with zipfile.ZipFile(buf,'r') as zip:
                 zip.extractall(os.path.join(Globals.root,'models/clipseg'))
-            os.remove(dest)
-
-            from clipseg.clipseg import CLIPDensePredT
-            model = CLIPDensePredT(version='ViT-B/16', reduce_dim=64, )
-            model.eval()
-            model.load_state_dict(
-                torch.load(
-                    os.path.join(Globals.root,'models/clipseg/clipseg_weights/rd64-uni-refined.pth'),
-                    map_location=torch.device('cpu')
-                    ),
-                strict=False,
-            )
+
+            # a cheap sanity check; the model itself is only loaded at inference time
+            weights_path = os.path.join(model_dest,'rd64-uni-refined.pth')
+            if os.path.getsize(weights_path) == 0:
+                raise ValueError(f'{weights_path} is empty')
+        print('...clipseg model installed',file=sys.stderr)
     except Exception:
         print('Error installing clipseg model:')
         print(traceback.format_exc())
-    print('...success',file=sys.stderr)
 
 #-------------------------------------
 def download_safety_checker():
@@ -522,11 +646,9 @@ def download_safety_checker():
         print(traceback.format_exc())
         return
     safety_model_id = "CompVis/stable-diffusion-safety-checker"
-    print('AutoFeatureExtractor...', end='',file=sys.stderr)
     download_from_hf(AutoFeatureExtractor,safety_model_id)
-    print('StableDiffusionSafetyChecker...', end='',file=sys.stderr)
     download_from_hf(StableDiffusionSafetyChecker,safety_model_id)
-    print('...success',file=sys.stderr)
+    print('...NSFW content detection model installed',file=sys.stderr)
 
 #-------------------------------------
 def download_weights(opt:dict) -> Union[str, None]:
@@ -660,7 +782,7 @@ def initialize_rootdir(root:str,yes_to_all:bool=False):
     for src in (['configs']):
         dest = os.path.join(root,src)
         if not os.path.samefile(src,dest):
-            shutil.copytree(src,dest,dirs_exist_ok=True)
+            shutil.copytree(src,dest,dirs_exist_ok=True,ignore=shutil.ignore_patterns('*.cache.json'))
         os.makedirs(outputs, exist_ok=True)
 
     init_file = os.path.join(Globals.root,Globals.initfile)
@@ -688,22 +810,6 @@ def initialize_rootdir(root:str,yes_to_all:bool=False):
 #
 ''')
 
-#-------------------------------------
-class ProgressBar():
-    def __init__(self,model_name='file'):
-        self.pbar = None
-        self.name = model_name
-
-    def __call__(self, block_num, block_size, total_size):
-        if not self.pbar:
-            self.pbar=tqdm(desc=self.name,
-                           initial=0,
-                           unit='iB',
-                           unit_scale=True,
-                           unit_divisor=1000,
-                           total=total_size)
-        self.pbar.update(block_size)
-
 #-------------------------------------
 def main():
     parser = argparse.ArgumentParser(description='InvokeAI model downloader')
@@ -748,13 +854,17 @@ def main():
             print('** DOWNLOADING DIFFUSION WEIGHTS **')
             errors.add(download_weights(opt))
         print('\n** DOWNLOADING SUPPORT MODELS **')
-        download_bert()
-        download_clip()
-        download_realesrgan()
-        download_gfpgan()
-        download_codeformer()
-        download_clipseg()
-        download_safety_checker()
+        # these come from unrelated hosts, so fetch them side by side
+        tasks = [
+            download_bert,
+            download_clip,
+            download_realesrgan,
+            download_gfpgan,
+            download_codeformer,
+            download_clipseg,
+            download_safety_checker,
+        ]
+        _run_parallel(lambda task: task(), tasks)
         postscript(errors=errors)
     except KeyboardInterrupt:
         print('\nGoodbye! Come back soon.')
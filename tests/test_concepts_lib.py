@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ldm.invoke import concepts_lib
+from ldm.invoke.concepts_lib import Concepts, AUTOMATON_MIN_TRIGGERS
+
+
+def make_concept(root:str, concept_name:str, trigger:str):
+    path = os.path.join(root,'models','sd-concepts-library',concept_name)
+    os.makedirs(path)
+    with open(os.path.join(path,'token_identifier.txt'),'w') as f:
+        f.write(trigger)
+
+
+class ReplaceTriggersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for i in range(AUTOMATON_MIN_TRIGGERS):
+            make_concept(self.root, f'concept-{i}', f'<trigger-{i}>')
+        make_concept(self.root, 'bare', 'sks')
+        make_concept(self.root, 'short', '<s>')
+        make_concept(self.root, 'spaced', '<two words>')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def replace(self, prompt:str, use_automaton:bool)->str:
+        saved = concepts_lib.ahocorasick_available
+        concepts_lib.ahocorasick_available = saved and use_automaton
+        try:
+            return Concepts(self.root).replace_triggers_with_concepts(prompt)
+        finally:
+            concepts_lib.ahocorasick_available = saved
+
+    def test_regex(self):
+        self.assertEqual('a <concept-3> in the style of <spaced>',
+                         self.replace('a <trigger-3> in the style of <two words>', use_automaton=False))
+        self.assertEqual('sksks asks <unknown>', self.replace('sksks asks <unknown>', use_automaton=False))
+
+    @unittest.skipUnless(concepts_lib.ahocorasick_available, 'pyahocorasick is not installed')
+    def test_automaton_matches_regex(self):
+        self.assertIsNotNone(Concepts(self.root)._trigger_automaton())
+        prompts = [
+            '',
+            'a photograph of an astronaut',
+            'a <trigger-3> in the style of <two words>',
+            'sksks asks sks',
+            '<s><s> <<s>> <s <trigger-1> <trigger-10> <trigger-1>0',
+            '<unknown> and <trigger-31>, <trigger-0>',
+        ]
+        for prompt in prompts:
+            with self.subTest(prompt=prompt):
+                self.assertEqual(self.replace(prompt, use_automaton=False),
+                                 self.replace(prompt, use_automaton=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import yaml
+
+# configure_invokeai reads ./configs/INITIAL_MODELS.yaml when it is imported,
+# so import it from a scratch directory holding a copy of that file
+_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_scratch = tempfile.mkdtemp()
+os.makedirs(os.path.join(_scratch,'configs'))
+shutil.copy(os.path.join(_REPO,'configs','INITIAL_MODELS.yaml'), os.path.join(_scratch,'configs'))
+sys.path.insert(0, os.path.join(_REPO,'scripts'))
+_cwd = os.getcwd()
+try:
+    os.chdir(_scratch)
+    configure_invokeai = importlib.import_module('configure_invokeai')
+finally:
+    os.chdir(_cwd)
+    shutil.rmtree(_scratch)
+
+
+def model(config:str, file:str)->dict:
+    return dict(description=file, repo_id=f'test/{file}', config=config, file=file,
+                recommended=False, width=512, height=512)
+
+CATALOG = {
+    'stable-diffusion-1.5': model('v1-inference.yaml', 'v1-5-pruned-emaonly.ckpt'),
+    'trinart_characters-1.0': model('v1-inference.yaml', 'trinart_characters_it4_v1.ckpt'),
+    'trinart_vae': model('VAE/trinart', 'autoencoder_fix_kl-f8-trinart_characters.ckpt'),
+    'ft-mse-improved-autoencoder-840000': model('VAE/default', 'vae-ft-mse-840000-ema-pruned.ckpt'),
+}
+
+
+class NewConfigFileContentsTestCase(unittest.TestCase):
+
+    def new_config(self, downloaded:list)->dict:
+        with patch.object(configure_invokeai, 'Datasets', CATALOG):
+            contents = configure_invokeai.new_config_file_contents(
+                dict.fromkeys(downloaded, True), os.path.join(tempfile.gettempdir(),'no-such-models.yaml')
+            )
+        return yaml.safe_load(contents)
+
+    def vae(self, file:str)->str:
+        return os.path.normpath(os.path.join('models','ldm/stable-diffusion-v1/',file))
+
+    def test_vae_selection(self):
+        conf = self.new_config(CATALOG.keys())
+        self.assertEqual(['stable-diffusion-1.5','trinart_characters-1.0'], list(conf.keys()))
+        self.assertEqual(self.vae('vae-ft-mse-840000-ema-pruned.ckpt'), conf['stable-diffusion-1.5']['vae'])
+        self.assertEqual(self.vae('autoencoder_fix_kl-f8-trinart_characters.ckpt'), conf['trinart_characters-1.0']['vae'])
+        self.assertTrue(conf['stable-diffusion-1.5']['default'])
+        self.assertNotIn('default', conf['trinart_characters-1.0'])
+
+    def test_no_default_vae(self):
+        conf = self.new_config(['stable-diffusion-1.5','trinart_characters-1.0','trinart_vae'])
+        self.assertNotIn('vae', conf['stable-diffusion-1.5'])
+        self.assertEqual(self.vae('autoencoder_fix_kl-f8-trinart_characters.ckpt'), conf['trinart_characters-1.0']['vae'])
+
+
+if __name__ == '__main__':
+    unittest.main()